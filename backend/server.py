@@ -1,17 +1,25 @@
 from fastapi import FastAPI, APIRouter, HTTPException
+from fastapi.responses import ORJSONResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import AsyncMongoClient
+import asyncio
 import os
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict
 from typing import List, Optional
+import re
+import threading
 import uuid
 from datetime import datetime, timezone
+from io import BytesIO
 import requests
-import xml.etree.ElementTree as ET
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from lxml import etree as ET
+from lxml import html as lhtml
+from concurrent.futures import ThreadPoolExecutor
 import time
 
 
@@ -20,15 +28,52 @@ load_dotenv(ROOT_DIR / '.env')
 
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncMongoClient(mongo_url)
 db = client[os.environ['DB_NAME']]
 
-# Create the main app without a prefix
-app = FastAPI()
+# Create the main app without a prefix; orjson serializes the large
+# list responses in C and handles datetimes natively
+app = FastAPI(default_response_class=ORJSONResponse)
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
 
+# Thread pool for blocking SEC calls; the worker count only bounds
+# concurrency, the rate limiter below is what keeps request pacing
+# under SEC's 10 requests/second cap
+sec_executor = ThreadPoolExecutor(max_workers=8)
+
+
+class RateLimiter:
+    """Spaces out requests across threads to honor SEC's rate cap"""
+
+    def __init__(self, per_second):
+        self._interval = 1.0 / per_second
+        self._lock = threading.Lock()
+        self._next_time = 0.0
+
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next_time - now
+            self._next_time = max(now, self._next_time) + self._interval
+        if wait > 0:
+            time.sleep(wait)
+
+
+SEC_RATE_LIMITER = RateLimiter(9)
+
+# Cached responses for the read endpoints, stored as (value, timestamp)
+# pairs. Refresh clears them in the worker that handled it; the TTL
+# bounds how stale the other gunicorn workers can get.
+_CACHE_TTL_SECONDS = 60
+_stats_cache = None
+_execs_cache = None
+
+
+def _cache_fresh(entry):
+    return entry is not None and (time.monotonic() - entry[1]) < _CACHE_TTL_SECONDS
+
 
 # Define Models
 class InsiderTransaction(BaseModel):
@@ -47,6 +92,10 @@ class InsiderTransaction(BaseModel):
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 
+# Project exactly the model fields so Mongo ships no stray bytes
+_TRANSACTION_PROJECTION = {"_id": 0, **{f: 1 for f in InsiderTransaction.model_fields}}
+
+
 class ExecutiveSummary(BaseModel):
     name: str
     total_sales: float
@@ -62,154 +111,225 @@ class DashboardStats(BaseModel):
 
 
 # SEC EDGAR API helper functions
-def fetch_sec_filings(cik: str = "0001327811", form_type: str = "4"):
+SEC_HEADERS = {
+    'User-Agent': 'InsiderTracker contact@example.com',
+    'Accept-Encoding': 'gzip, deflate',
+    'Host': 'www.sec.gov'
+}
+
+# Shared session so SEC calls reuse keep-alive connections instead of
+# paying a TCP+TLS handshake per request
+sec_session = requests.Session()
+sec_session.headers.update(SEC_HEADERS)
+sec_session.mount('https://', HTTPAdapter(
+    pool_connections=10,
+    pool_maxsize=10,
+    max_retries=Retry(total=3, backoff_factor=0.5, status_forcelist=[429, 502, 503])
+))
+
+
+def fetch_sec_filings(cik: str = "0001327811", form_type: str = "4", conditional_headers: Optional[dict] = None):
     """
     Fetch recent SEC Form 4 filings for Workday (CIK: 0001327811)
+
+    Returns (html, validators, not_modified). When the cached ETag /
+    Last-Modified still matches, html is None and not_modified is True
+    so the caller can skip all parsing.
     """
-    headers = {
-        'User-Agent': 'InsiderTracker contact@example.com',
-        'Accept-Encoding': 'gzip, deflate',
-        'Host': 'www.sec.gov'
-    }
-    
     url = f"https://www.sec.gov/cgi-bin/browse-edgar?action=getcompany&CIK={cik}&type={form_type}&dateb=&owner=include&count=100&search_text="
-    
+
     try:
-        response = requests.get(url, headers=headers, timeout=10)
+        SEC_RATE_LIMITER.acquire()
+        response = sec_session.get(url, timeout=10, headers=conditional_headers or {})
+        if response.status_code == 304:
+            return None, None, True
         response.raise_for_status()
-        return response.text
+
+        validators = {}
+        if response.headers.get('ETag'):
+            validators['etag'] = response.headers['ETag']
+        if response.headers.get('Last-Modified'):
+            validators['last_modified'] = response.headers['Last-Modified']
+
+        return response.text, validators, False
     except Exception as e:
         logging.error(f"Error fetching SEC filings: {e}")
-        return None
+        return None, None, False
+
+
+# One HTML parser instance, configured once and reused for every
+# document instead of building a fresh parser per parse
+_HTML_PARSER = lhtml.HTMLParser()
+
+# Fast path for the very regular browse-edgar table: type-4 row,
+# documents link, description cell, then the filing date
+_FILING_ROW_RE = re.compile(
+    r'<tr[^>]*>\s*<td[^>]*>\s*4\s*</td>\s*'
+    r'<td[^>]*>.*?<a[^>]+href="([^"]+)".*?</td>\s*'
+    r'<td[^>]*>.*?</td>\s*'
+    r'<td[^>]*>\s*(\d{4}-\d{2}-\d{2})\s*</td>',
+    re.S
+)
 
 
 def parse_sec_filings_list(html_content: str):
     """
     Parse the SEC filings list page to extract document links
     """
-    soup = BeautifulSoup(html_content, 'html.parser')
     filings = []
-    
-    table = soup.find('table', {'class': 'tableFile2'})
-    if not table:
+
+    # Scan the raw HTML first; no DOM needs to be built when the
+    # table matches the expected layout
+    for match in _FILING_ROW_RE.finditer(html_content):
+        href, filing_date = match.groups()
+        filings.append({
+            'filing_date': filing_date,
+            'documents_url': "https://www.sec.gov" + href
+        })
+        if len(filings) >= 20:  # Limit to recent 20 filings
+            break
+
+    if filings:
         return filings
-    
-    rows = table.find_all('tr')[1:]  # Skip header
-    
+
+    # Fallback: full DOM parse for layouts the regex doesn't match
+    doc = lhtml.fromstring(html_content, parser=_HTML_PARSER)
+    rows = doc.xpath("//table[@class='tableFile2']//tr")[1:]  # Skip header
+
     for row in rows[:20]:  # Limit to recent 20 filings
-        cols = row.find_all('td')
+        cols = row.xpath('./td')
         if len(cols) >= 4:
-            filing_type = cols[0].text.strip()
-            filing_date = cols[3].text.strip()
-            documents_link = cols[1].find('a')
-            
-            if documents_link and filing_type == '4':
-                doc_url = "https://www.sec.gov" + documents_link['href']
+            filing_type = cols[0].text_content().strip()
+            filing_date = cols[3].text_content().strip()
+            hrefs = cols[1].xpath('.//a/@href')
+
+            if hrefs and filing_type == '4':
+                doc_url = "https://www.sec.gov" + hrefs[0]
                 filings.append({
                     'filing_date': filing_date,
                     'documents_url': doc_url
                 })
-    
+
     return filings
 
 
-def parse_form4_xml(xml_content: str, filing_date: str):
+# XPath expressions compiled once; reused for every element in every
+# filing processed during a refresh
+_XP_OWNER_NAME = ET.XPath('reportingOwnerId/rptOwnerName/text()')
+_XP_OWNER_TITLE = ET.XPath('reportingOwnerRelationship/officerTitle/text()')
+_XP_TRANS_DATE = ET.XPath('transactionDate/value/text()')
+_XP_SHARES = ET.XPath('transactionAmounts/transactionShares/value/text()')
+_XP_PRICE = ET.XPath('transactionAmounts/transactionPricePerShare/value/text()')
+_XP_ACQ_DISP = ET.XPath('transactionAmounts/transactionAcquiredDisposedCode/value/text()')
+
+
+def parse_form4_xml(xml_content: bytes, filing_date: str):
     """
-    Parse Form 4 XML to extract transaction details
+    Parse Form 4 XML bytes to extract transaction details
     """
     transactions = []
-    
+    owner_name = None
+    title = "Executive"
+
     try:
-        root = ET.fromstring(xml_content)
-        
-        # Extract reporting owner info
-        owner = root.find('.//reportingOwner')
-        if owner is None:
-            return transactions
-            
-        owner_name_elem = owner.find('.//rptOwnerName')
-        if owner_name_elem is None:
-            return transactions
-            
-        owner_name = owner_name_elem.text
-        
-        # Extract title if available
-        title_elem = owner.find('.//reportingOwnerRelationship/officerTitle')
-        title = title_elem.text if title_elem is not None else "Executive"
-        
-        # Parse non-derivative transactions
-        for trans in root.findall('.//nonDerivativeTransaction'):
-            try:
-                trans_date = trans.find('.//transactionDate/value')
-                trans_code = trans.find('.//transactionCoding/transactionCode')
-                shares = trans.find('.//transactionAmounts/transactionShares/value')
-                price = trans.find('.//transactionAmounts/transactionPricePerShare/value')
-                acquired_disposed = trans.find('.//transactionAmounts/transactionAcquiredDisposedCode/value')
-                
-                if all([trans_date is not None, shares is not None, price is not None]):
-                    trans_date_str = trans_date.text
-                    shares_val = float(shares.text)
-                    price_val = float(price.text)
-                    total_val = shares_val * price_val
-                    
-                    code = trans_code.text if trans_code is not None else "S"
-                    acq_disp = acquired_disposed.text if acquired_disposed is not None else "D"
-                    
-                    trans_type = "Sale" if acq_disp == "D" else "Purchase"
-                    
-                    transactions.append({
-                        'executive_name': owner_name,
-                        'executive_title': title,
-                        'transaction_date': trans_date_str,
-                        'transaction_type': trans_type,
-                        'shares': shares_val,
-                        'price_per_share': price_val,
-                        'total_value': total_val,
-                        'filing_date': filing_date,
-                        'form_type': 'Form 4'
-                    })
-            except Exception as e:
-                logging.error(f"Error parsing transaction: {e}")
-                continue
-                
+        # Stream the document instead of building the full tree; only
+        # the elements we care about are materialized, and each one is
+        # released as soon as it has been read
+        context = ET.iterparse(
+            BytesIO(xml_content),
+            events=('end',),
+            tag=('reportingOwner', 'nonDerivativeTransaction')
+        )
+
+        for _, elem in context:
+            if elem.tag == 'reportingOwner':
+                # Joint filings list several owners; keep the first
+                # one's name and title together, as the old full-tree
+                # lookup did
+                if owner_name is None:
+                    names = _XP_OWNER_NAME(elem)
+                    if names:
+                        owner_name = names[0]
+
+                    titles = _XP_OWNER_TITLE(elem)
+                    if titles and titles[0]:
+                        title = titles[0]
+            else:
+                try:
+                    trans_dates = _XP_TRANS_DATE(elem)
+                    shares = _XP_SHARES(elem)
+                    prices = _XP_PRICE(elem)
+                    acq_disps = _XP_ACQ_DISP(elem)
+
+                    if trans_dates and shares and prices:
+                        trans_date_str = trans_dates[0]
+                        shares_val = float(shares[0])
+                        price_val = float(prices[0])
+                        total_val = shares_val * price_val
+
+                        acq_disp = acq_disps[0] if acq_disps else "D"
+
+                        trans_type = "Sale" if acq_disp == "D" else "Purchase"
+
+                        transactions.append({
+                            'transaction_date': trans_date_str,
+                            'transaction_type': trans_type,
+                            'shares': shares_val,
+                            'price_per_share': price_val,
+                            'total_value': total_val,
+                            'filing_date': filing_date,
+                            'form_type': 'Form 4'
+                        })
+                except Exception as e:
+                    logging.error(f"Error parsing transaction: {e}")
+
+            # Release the element and any fully-parsed siblings before it
+            elem.clear()
+            while elem.getprevious() is not None:
+                del elem.getparent()[0]
+
+        if owner_name is None:
+            return []
+
+        for trans in transactions:
+            trans['executive_name'] = owner_name
+            trans['executive_title'] = title
+
     except Exception as e:
         logging.error(f"Error parsing Form 4 XML: {e}")
-    
+        return []
+
     return transactions
 
 
 def fetch_and_parse_form4(documents_url: str, filing_date: str):
     """
-    Fetch the Form 4 XML from the documents page
+    Fetch the Form 4 XML for a filing via its JSON directory index
     """
-    headers = {
-        'User-Agent': 'InsiderTracker contact@example.com',
-        'Accept-Encoding': 'gzip, deflate',
-        'Host': 'www.sec.gov'
-    }
-    
     try:
-        # Fetch documents page
-        response = requests.get(documents_url, headers=headers, timeout=10)
+        # The filing directory has a machine-readable index; no need to
+        # scrape the documents HTML page for the XML link
+        filing_dir = documents_url.rsplit('/', 1)[0]
+        SEC_RATE_LIMITER.acquire()
+        response = sec_session.get(f"{filing_dir}/index.json", timeout=10)
         response.raise_for_status()
-        soup = BeautifulSoup(response.text, 'html.parser')
-        
-        # Find XML link
-        for link in soup.find_all('a'):
-            href = link.get('href', '')
-            if '.xml' in href and 'xslF345X' not in href:
-                xml_url = "https://www.sec.gov" + href if href.startswith('/') else href
-                
+
+        items = response.json().get('directory', {}).get('item', [])
+        for item in items:
+            name = item.get('name', '')
+            if name.endswith('.xml') and 'xslF345X' not in name:
                 # Fetch XML
-                time.sleep(0.2)  # Be nice to SEC servers
-                xml_response = requests.get(xml_url, headers=headers, timeout=10)
+                SEC_RATE_LIMITER.acquire()
+                xml_response = sec_session.get(f"{filing_dir}/{name}", timeout=10)
                 xml_response.raise_for_status()
-                
-                return parse_form4_xml(xml_response.text, filing_date)
-        
+
+                # Bytes go straight into lxml, which handles the
+                # declared encoding itself; no str round trip
+                return parse_form4_xml(xml_response.content, filing_date)
+
     except Exception as e:
         logging.error(f"Error fetching Form 4 XML: {e}")
-    
+
     return []
 
 
@@ -225,17 +345,9 @@ async def get_transactions():
     Get all cached transactions from database
     """
     try:
-        transactions = await db.transactions.find({}, {"_id": 0}).to_list(1000)
-        
-        # Convert ISO string timestamps back to datetime objects
-        for trans in transactions:
-            if isinstance(trans.get('created_at'), str):
-                trans['created_at'] = datetime.fromisoformat(trans['created_at'])
-        
-        # Sort by transaction date descending
-        transactions.sort(key=lambda x: x.get('transaction_date', ''), reverse=True)
-        
-        return transactions
+        # Sort by transaction date descending, server-side
+        cursor = db.transactions.find({}, _TRANSACTION_PROJECTION).sort("transaction_date", -1).limit(1000)
+        return await cursor.to_list(1000)
     except Exception as e:
         logging.error(f"Error fetching transactions: {e}")
         raise HTTPException(status_code=500, detail="Error fetching transactions")
@@ -247,36 +359,87 @@ async def refresh_transactions():
     Fetch fresh data from SEC EDGAR and update database
     """
     try:
-        # Fetch SEC filings list
-        html_content = fetch_sec_filings()
+        loop = asyncio.get_running_loop()
+
+        # Send cached validators so SEC can answer 304 when nothing
+        # new has been filed
+        meta = await db.meta.find_one({'_id': 'sec_filings_index'}) or {}
+        conditional_headers = {}
+        if meta.get('etag'):
+            conditional_headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+            conditional_headers['If-Modified-Since'] = meta['last_modified']
+
+        # Fetch SEC filings list off the event loop
+        html_content, validators, not_modified = await loop.run_in_executor(
+            sec_executor, fetch_sec_filings, "0001327811", "4", conditional_headers
+        )
+
+        if not_modified:
+            return {
+                "success": True,
+                "transactions_count": 0,
+                "message": "SEC filings index unchanged; nothing to refresh"
+            }
+
         if not html_content:
             raise HTTPException(status_code=500, detail="Failed to fetch SEC data")
-        
+
         filings = parse_sec_filings_list(html_content)
-        
+
+        # Fetch filings concurrently; the pool size bounds concurrency
+        results = await asyncio.gather(
+            *[
+                loop.run_in_executor(
+                    sec_executor,
+                    fetch_and_parse_form4,
+                    filing['documents_url'],
+                    filing['filing_date']
+                )
+                for filing in filings[:15]  # Process last 15 filings
+            ]
+        )
+
         all_transactions = []
-        for filing in filings[:15]:  # Process last 15 filings
-            transactions = fetch_and_parse_form4(
-                filing['documents_url'],
-                filing['filing_date']
-            )
+        for transactions in results:
             all_transactions.extend(transactions)
-            time.sleep(0.3)  # Rate limiting
-        
-        # Clear old data and insert new
-        await db.transactions.delete_many({})
-        
-        if all_transactions:
-            # Convert to InsiderTransaction objects
-            trans_objects = []
-            for trans in all_transactions:
-                trans_obj = InsiderTransaction(**trans)
-                doc = trans_obj.model_dump()
-                doc['created_at'] = doc['created_at'].isoformat()
-                trans_objects.append(doc)
-            
-            await db.transactions.insert_many(trans_objects)
-        
+
+        if not all_transactions:
+            # Every per-filing fetch failed or parsed empty. Keep the
+            # existing data and do NOT pin the index validators, so the
+            # next refresh retries from scratch instead of getting 304s
+            # against a wiped collection
+            return {
+                "success": True,
+                "transactions_count": 0,
+                "message": "No transactions parsed; keeping existing data"
+            }
+
+        # Validate and serialize in one pass; mode='json' renders
+        # the created_at datetime as an ISO string
+        trans_objects = [
+            InsiderTransaction(**trans).model_dump(mode='json')
+            for trans in all_transactions
+        ]
+
+        # Build the new data in a staging collection and swap it in
+        # atomically so readers never see an empty collection
+        await db.transactions_new.drop()
+        await db.transactions_new.insert_many(trans_objects, ordered=False)
+        await db.transactions_new.rename("transactions", dropTarget=True)
+        await ensure_transaction_indexes()
+
+        # Invalidate cached read responses
+        global _stats_cache, _execs_cache
+        _stats_cache = None
+        _execs_cache = None
+
+        # Remember the index validators only after a successful refresh
+        if validators:
+            await db.meta.update_one(
+                {'_id': 'sec_filings_index'}, {'$set': validators}, upsert=True
+            )
+
         return {
             "success": True,
             "transactions_count": len(all_transactions),
@@ -293,43 +456,52 @@ async def get_dashboard_stats():
     """
     Get dashboard statistics
     """
+    global _stats_cache
+
+    if _cache_fresh(_stats_cache):
+        return _stats_cache[0]
+
     try:
-        transactions = await db.transactions.find({}, {"_id": 0}).to_list(1000)
-        
-        if not transactions:
+        # Aggregate server-side instead of pulling every document
+        pipeline = [
+            {"$group": {
+                "_id": None,
+                "total_sales": {"$sum": {"$cond": [
+                    {"$eq": ["$transaction_type", "Sale"]}, "$total_value", 0
+                ]}},
+                "total_transactions": {"$sum": 1},
+                "executives": {"$addToSet": "$executive_name"},
+                "latest": {"$max": "$created_at"}
+            }}
+        ]
+        cursor = await db.transactions.aggregate(pipeline)
+        results = await cursor.to_list(1)
+
+        if not results:
             return DashboardStats(
                 total_sales_value=0,
                 total_transactions=0,
                 unique_executives=0,
                 last_updated="Never"
             )
-        
-        # Calculate stats
-        total_sales = sum(
-            t['total_value'] for t in transactions 
-            if t.get('transaction_type') == 'Sale'
-        )
-        
-        unique_execs = len(set(t['executive_name'] for t in transactions))
-        
-        # Get most recent update
-        latest = max(
-            (t.get('created_at') for t in transactions if t.get('created_at')),
-            default=None
-        )
-        
+
+        stats = results[0]
+
+        latest = stats.get('latest')
         if isinstance(latest, str):
             latest = datetime.fromisoformat(latest)
-        
+
         last_updated = latest.strftime("%Y-%m-%d %H:%M UTC") if latest else "Unknown"
-        
-        return DashboardStats(
-            total_sales_value=total_sales,
-            total_transactions=len(transactions),
-            unique_executives=unique_execs,
+
+        result = DashboardStats(
+            total_sales_value=stats['total_sales'],
+            total_transactions=stats['total_transactions'],
+            unique_executives=len(stats['executives']),
             last_updated=last_updated
         )
-        
+        _stats_cache = (result, time.monotonic())
+        return result
+
     except Exception as e:
         logging.error(f"Error calculating stats: {e}")
         raise HTTPException(status_code=500, detail="Error calculating statistics")
@@ -340,44 +512,39 @@ async def get_executives():
     """
     Get executive-level summary
     """
+    global _execs_cache
+
+    if _cache_fresh(_execs_cache):
+        return _execs_cache[0]
+
     try:
-        transactions = await db.transactions.find({}, {"_id": 0}).to_list(1000)
-        
-        # Group by executive
-        exec_data = {}
-        for trans in transactions:
-            name = trans['executive_name']
-            if name not in exec_data:
-                exec_data[name] = {
-                    'name': name,
-                    'total_sales': 0,
-                    'transaction_count': 0,
-                    'latest_date': trans['transaction_date']
-                }
-            
-            if trans.get('transaction_type') == 'Sale':
-                exec_data[name]['total_sales'] += trans['total_value']
-            
-            exec_data[name]['transaction_count'] += 1
-            
-            if trans['transaction_date'] > exec_data[name]['latest_date']:
-                exec_data[name]['latest_date'] = trans['transaction_date']
-        
-        # Convert to list and sort by total sales
+        # Group by executive server-side, sorted by total sales
+        pipeline = [
+            {"$group": {
+                "_id": "$executive_name",
+                "total_sales": {"$sum": {"$cond": [
+                    {"$eq": ["$transaction_type", "Sale"]}, "$total_value", 0
+                ]}},
+                "transaction_count": {"$sum": 1},
+                "latest_transaction": {"$max": "$transaction_date"}
+            }},
+            {"$sort": {"total_sales": -1}}
+        ]
+        cursor = await db.transactions.aggregate(pipeline)
+        rows = await cursor.to_list(1000)
+
         result = [
             ExecutiveSummary(
-                name=data['name'],
-                total_sales=data['total_sales'],
-                transaction_count=data['transaction_count'],
-                latest_transaction=data['latest_date']
+                name=row['_id'],
+                total_sales=row['total_sales'],
+                transaction_count=row['transaction_count'],
+                latest_transaction=row['latest_transaction']
             )
-            for data in exec_data.values()
+            for row in rows
         ]
-        
-        result.sort(key=lambda x: x.total_sales, reverse=True)
-        
+        _execs_cache = (result, time.monotonic())
         return result
-        
+
     except Exception as e:
         logging.error(f"Error fetching executives: {e}")
         raise HTTPException(status_code=500, detail="Error fetching executives")
@@ -401,6 +568,19 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+async def ensure_transaction_indexes():
+    # Keep the aggregation and sort paths index-covered
+    await db.transactions.create_index([("transaction_date", -1)])
+    await db.transactions.create_index("executive_name")
+    await db.transactions.create_index("transaction_type")
+    await db.transactions.create_index([("executive_name", 1), ("transaction_type", 1)])
+
+
+@app.on_event("startup")
+async def create_db_indexes():
+    await ensure_transaction_indexes()
+
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
+    await client.close()
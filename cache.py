@@ -0,0 +1,47 @@
+"""
+On-disk cache for fetched Yahoo Finance pages
+
+Repeated runs of the updater within a TTL window serve the raw HTML
+from disk instead of re-hitting Yahoo. Price moves quickly so it gets
+a short TTL; the holders table only changes with quarterly filings.
+"""
+
+import hashlib
+import os
+import tempfile
+import time
+from pathlib import Path
+
+CACHE_DIR = Path("./.cache")
+
+
+class FileCache:
+    """Byte cache keyed by URL with a fixed TTL"""
+
+    def __init__(self, ttl_seconds, cache_dir=CACHE_DIR):
+        self.ttl_seconds = ttl_seconds
+        self.cache_dir = Path(cache_dir)
+
+    def _path(self, url):
+        return self.cache_dir / f"{hashlib.md5(url.encode()).hexdigest()}.html"
+
+    def get(self, url):
+        """Return cached bytes for url, or None if missing or stale"""
+        path = self._path(url)
+        try:
+            if path.exists() and (time.time() - path.stat().st_mtime) < self.ttl_seconds:
+                return path.read_bytes()
+        except OSError:
+            pass  # unreadable entry; treat as a miss
+        return None
+
+    def set(self, url, content):
+        """Store bytes for url, atomically via rename"""
+        path = self._path(url)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        # Unique temp name per writer so concurrent callers storing the
+        # same url never share (and corrupt) one temp file
+        fd, tmp_name = tempfile.mkstemp(dir=self.cache_dir)
+        with os.fdopen(fd, 'wb') as fh:
+            fh.write(content)
+        os.replace(tmp_name, path)
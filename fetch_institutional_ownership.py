@@ -4,152 +4,224 @@ VERSION 4 - FIXED: Proper validation to avoid CUSIP confusion
 """
 
 import requests
-import json
+import orjson
+import os
+import tempfile
+import threading
 import time
-import xml.etree.ElementTree as ET
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from lxml import etree
+from lxml import html as lhtml
 from datetime import datetime
+from functools import lru_cache
+from io import BytesIO
 from pathlib import Path
 import re
 
+import sec_cache
+
 # Configuration
 WDAY_CUSIP = "98138H101"
+
+# findtext paths for the streaming 13F parser, hoisted so they are not
+# rebuilt per element
+_P_CUSIP = '{*}cusip'
+_P_SHARES = '{*}shrsOrPrnAmt/{*}sshPrnamt'
+_P_VALUE = '{*}value'
+
+# CUSIP-derived decoy numbers that must never be read as share counts
+_CUSIP_BAD = frozenset({98138, 98138101})
 OUTPUT_DIR = Path("./public_data")
 OUTPUT_DIR.mkdir(exist_ok=True)
 
+# Pattern compiled once; this runs per context line per CUSIP hit
+_RE_NUMBERS = re.compile(r'\d[\d,]*')
+
+# Parallel fetching: SEC allows 10 requests/second, so spread the
+# requests of up to 8 workers with a shared limiter pinned just below
+MAX_WORKERS = 8
+
+# One pooled session so all workers reuse keep-alive connections to
+# www.sec.gov instead of paying a TLS handshake per request
+SESSION = requests.Session()
+SESSION.headers.update({
+    'User-Agent': 'InsiderTracker contact@example.com',
+    'Accept-Encoding': 'gzip, deflate',
+})
+SESSION.mount('https://', HTTPAdapter(
+    pool_connections=16,
+    pool_maxsize=32,
+    max_retries=Retry(total=3, backoff_factor=0.5)
+))
+
+
+class RateLimiter:
+    """Spaces out requests across threads to honor SEC's rate cap"""
+
+    def __init__(self, per_second):
+        self._interval = 1.0 / per_second
+        self._lock = threading.Lock()
+        self._next_time = 0.0
+
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next_time - now
+            self._next_time = max(now, self._next_time) + self._interval
+        if wait > 0:
+            time.sleep(wait)
+
+
+SEC_RATE_LIMITER = RateLimiter(9)
+
+
+def sec_get(url, timeout=10, ttl=sec_cache.DOCUMENT_TTL):
+    """Cached GET; network fetches share the session and rate limiter"""
+    return sec_cache.cached_get(
+        url, SESSION, ttl=ttl, timeout=timeout, rate_limiter=SEC_RATE_LIMITER
+    )
+
 # Major institutional investors (expanded list)
-MAJOR_INVESTORS = {
-    '0000102909': 'Vanguard Group',
-    '0001364742': 'BlackRock',
-    '0000093751': 'State Street',
-    '0001166559': 'Fidelity',
-    '0001061768': 'Baillie Gifford',
-    '0001364439': 'Geode Capital',
-    '0001513882': 'Eagle Capital',
-    '0001336528': 'Invesco',
-    '0001029160': 'Northern Trust',
-    '0001336617': 'American Century',
-    '0000914208': 'Charles Schwab',
-    '0001337619': 'T. Rowe Price',
-    '0000354204': 'Morgan Stanley',
-    '0000886982': 'Goldman Sachs',
-    '0000019617': 'JPMorgan Chase',
-}
+MAJOR_INVESTORS = (
+    ('0000102909', 'Vanguard Group'),
+    ('0001364742', 'BlackRock'),
+    ('0000093751', 'State Street'),
+    ('0001166559', 'Fidelity'),
+    ('0001061768', 'Baillie Gifford'),
+    ('0001364439', 'Geode Capital'),
+    ('0001513882', 'Eagle Capital'),
+    ('0001336528', 'Invesco'),
+    ('0001029160', 'Northern Trust'),
+    ('0001336617', 'American Century'),
+    ('0000914208', 'Charles Schwab'),
+    ('0001337619', 'T. Rowe Price'),
+    ('0000354204', 'Morgan Stanley'),
+    ('0000886982', 'Goldman Sachs'),
+    ('0000019617', 'JPMorgan Chase'),
+)
+
+# Submissions URLs formatted once at import time rather than per run
+_SUBMISSION_URLS = tuple(
+    (cik, name, f"https://data.sec.gov/submissions/CIK{int(cik):010d}.json")
+    for cik, name in MAJOR_INVESTORS
+)
 
 
 def fetch_latest_13f_filings(max_per_investor=2):
     """Fetch recent 13F filings"""
-    headers = {
-        'User-Agent': 'InsiderTracker contact@example.com',
-        'Accept-Encoding': 'gzip, deflate',
-        'Host': 'www.sec.gov'
-    }
-    
+    def fetch_investor_filings(cik, name, url):
+        # The submissions API returns the recent filings as structured
+        # JSON; no HTML parsing and a far smaller payload.
+        # Submissions lists go stale as new filings arrive: short TTL
+        recent = orjson.loads(sec_get(url, ttl=sec_cache.INDEX_TTL))['filings']['recent']
+
+        cik_int = int(cik)
+        filings = []
+        for form, filing_date, accession in zip(
+            recent['form'], recent['filingDate'], recent['accessionNumber']
+        ):
+            if form != '13F-HR':
+                continue
+
+            doc_url = (
+                f"https://www.sec.gov/Archives/edgar/data/{cik_int}/"
+                f"{accession.replace('-', '')}/{accession}-index.htm"
+            )
+            filings.append({
+                'cik': cik,
+                'name': name,
+                'filing_date': filing_date,
+                'documents_url': doc_url
+            })
+
+            if len(filings) >= max_per_investor:
+                break
+
+        return filings
+
     all_filings = []
-    
+
     print(f"\n📊 Fetching 13F filings from {len(MAJOR_INVESTORS)} institutions...")
-    
-    for cik, name in MAJOR_INVESTORS.items():
-        print(f"  {name}...", end=" ")
-        
-        url = f"https://www.sec.gov/cgi-bin/browse-edgar?action=getcompany&CIK={cik}&type=13F-HR&dateb=&owner=exclude&count={max_per_investor}&search_text="
-        
-        try:
-            response = requests.get(url, headers=headers, timeout=10)
-            response.raise_for_status()
-            
-            soup = BeautifulSoup(response.text, 'html.parser')
-            table = soup.find('table', {'class': 'tableFile2'})
-            
-            if not table:
-                print("No filings")
-                continue
-            
-            rows = table.find_all('tr')[1:]
-            found = 0
-            
-            for row in rows[:max_per_investor]:
-                cols = row.find_all('td')
-                if len(cols) >= 4:
-                    filing_date = cols[3].text.strip()
-                    documents_link = cols[1].find('a')
-                    
-                    if documents_link:
-                        doc_url = "https://www.sec.gov" + documents_link['href']
-                        all_filings.append({
-                            'cik': cik,
-                            'name': name,
-                            'filing_date': filing_date,
-                            'documents_url': doc_url
-                        })
-                        found += 1
-            
-            print(f"✓ {found}")
-            time.sleep(0.3)
-            
-        except Exception as e:
-            print(f"Error")
-            continue
-    
+
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        futures = {
+            executor.submit(fetch_investor_filings, cik, name, url): name
+            for cik, name, url in _SUBMISSION_URLS
+        }
+
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                filings = future.result()
+                if filings:
+                    all_filings.extend(filings)
+                    print(f"  {name}... ✓ {len(filings)}")
+                else:
+                    print(f"  {name}... No filings")
+            except Exception as e:
+                print(f"  {name}... Error")
+
     print(f"\n✓ Total: {len(all_filings)} filings")
     return all_filings
 
 
-def parse_13f_xml_robust(xml_text):
-    """Parse 13F XML with namespace handling"""
-    if not xml_text:
+def parse_13f_xml_robust(xml_bytes):
+    """Parse 13F XML for the WDAY position in one streaming pass"""
+    # If the CUSIP never appears in the raw bytes the parser cannot find
+    # a WDAY position either; memchr beats a full tree walk on multi-MB
+    # filings
+    if not xml_bytes or WDAY_CUSIP.encode() not in xml_bytes:
         return None
-    
+
     try:
-        # Remove namespaces
-        xml_text = re.sub(r'xmlns[^"]*="[^"]*"', '', xml_text)
-        xml_text = re.sub(r'<\?xml[^>]*\?>', '', xml_text)
-        
-        root = ET.fromstring(xml_text.strip())
-        
-        # Search for WDAY CUSIP
-        for elem in root.iter():
-            # Look for CUSIP element
-            if elem.text and elem.text.strip() == WDAY_CUSIP:
-                # Found WDAY! Now find the parent infoTable
-                parent = elem
-                for _ in range(5):  # Go up max 5 levels
-                    parent = list(root.iter())[list(root.iter()).index(parent) - 1] if parent != root else None
-                    if parent is None:
-                        break
-                    
-                    # Look for shares and value in siblings
-                    shares_found = None
-                    value_found = None
-                    
-                    for child in parent.iter():
-                        tag_lower = child.tag.lower()
-                        
-                        # Find shares
-                        if 'sshprnamt' in tag_lower or 'shrs' in tag_lower:
-                            if child.text and child.text.strip().isdigit():
-                                shares_found = int(child.text.strip())
-                        
-                        # Find value (in thousands)
-                        if 'value' in tag_lower and 'valueUSD' not in tag_lower:
-                            if child.text and child.text.strip().isdigit():
-                                value_found = int(child.text.strip())
-                    
-                    if shares_found and value_found:
-                        # CRITICAL: Validate that shares != CUSIP number
-                        if shares_found != 98138 and shares_found > 100000:
-                            return {
-                                'shares': shares_found,
-                                'value_dollars': value_found * 1000
-                            }
+        # Stream infoTable entries instead of materializing the whole
+        # tree; {*} wildcards the namespace so no xmlns stripping is
+        # needed, and each entry is freed once inspected
+        context = etree.iterparse(
+            BytesIO(xml_bytes),
+            events=('end',),
+            tag='{*}infoTable',
+            recover=True
+        )
+
+        for _, info in context:
+            cusip = info.findtext(_P_CUSIP)
+            if cusip and cusip.strip() == WDAY_CUSIP:
+                shares_text = info.findtext(_P_SHARES)
+                value_text = info.findtext(_P_VALUE)  # in thousands
+
+                shares_found = None
+                value_found = None
+                if shares_text and shares_text.strip().isdigit():
+                    shares_found = int(shares_text.strip())
+                if value_text and value_text.strip().isdigit():
+                    value_found = int(value_text.strip())
+
+                if shares_found and value_found:
+                    # CRITICAL: Validate that shares != CUSIP number
+                    if shares_found != 98138 and shares_found > 100000:
+                        return {
+                            'shares': shares_found,
+                            'value_dollars': value_found * 1000
+                        }
+
+            info.clear()
+            while info.getprevious() is not None:
+                del info.getparent()[0]
     except Exception as e:
         pass
-    
+
     return None
 
 
 def parse_13f_text_strict(text_content):
     """Parse text with strict validation"""
+    # Same early exit as the XML path: no CUSIP, no position
+    if not text_content or WDAY_CUSIP not in text_content:
+        return None
+
     try:
         lines = text_content.split('\n')
         
@@ -168,43 +240,34 @@ def parse_13f_text_strict(text_content):
             if 'WORKDAY' not in context_text and 'WDAY' not in context_text:
                 continue
             
-            # Extract numbers (skip the CUSIP itself)
-            all_numbers = []
+            # Extract numbers (skip the CUSIP itself), tracking the
+            # smallest candidate in each range in a single pass
+            min_shares = None
+            min_value = None
             for ctx_line in context_lines:
                 # Skip the line with CUSIP
                 if WDAY_CUSIP in ctx_line:
                     continue
                 
-                # Find all numbers
-                numbers = re.findall(r'(\d[\d,]*)', ctx_line)
-                for num_str in numbers:
-                    num = int(num_str.replace(',', ''))
+                for match in _RE_NUMBERS.finditer(ctx_line):
+                    num = int(match.group().replace(',', ''))
                     
                     # CRITICAL VALIDATION
-                    # 1. Must not be the CUSIP number
-                    if num == 98138 or num == 98138101:
+                    # 1. Must not be a CUSIP-derived number
+                    if num in _CUSIP_BAD:
                         continue
                     
-                    # 2. Must be reasonable (shares: 100K-50M, value: >$10M)
-                    if num > 10000:
-                        all_numbers.append(num)
-            
-            if len(all_numbers) < 2:
-                continue
+                    # 2. Heuristic:
+                    #    - Shares are typically 100K-50M
+                    #    - Values are typically >$10M
+                    if 100000 < num < 50000000 and (min_shares is None or num < min_shares):
+                        min_shares = num
+                    if num > 10000000 and (min_value is None or num < min_value):
+                        min_value = num
             
-            # Sort numbers by magnitude
-            all_numbers.sort()
-            
-            # Heuristic: 
-            # - Shares are typically 1M-25M (middle range)
-            # - Values are typically $500M-$5B (large numbers)
-            
-            shares_candidates = [n for n in all_numbers if 100000 < n < 50000000]
-            value_candidates = [n for n in all_numbers if n > 10000000]
-            
-            if shares_candidates and value_candidates:
-                shares = shares_candidates[0]
-                value = value_candidates[0]
+            if min_shares is not None and min_value is not None:
+                shares = min_shares
+                value = min_value
                 
                 # Final sanity check: value should be shares * ~$200-300
                 expected_min = shares * 150
@@ -222,107 +285,109 @@ def parse_13f_text_strict(text_content):
     return None
 
 
-def download_and_parse_13f(documents_url, headers):
+@lru_cache(maxsize=512)
+def _resolve_13f_links(documents_url):
+    """Resolve candidate document URLs for a filing page (memoized)
+
+    Returns (xml_urls, txt_urls) bucketed by strategy priority: XML
+    information tables first, then any XML, then text files.
+    """
+    content = sec_get(documents_url)
+
+    info_xml_hrefs = []
+    xml_hrefs = []
+    txt_hrefs = []
+
+    for link in lhtml.fromstring(content).xpath('//a[@href]'):
+        href = link.get('href')
+        if '.xml' in href:
+            text = link.text_content().lower()
+            if any(kw in text for kw in ['information', 'infotable', 'table']):
+                info_xml_hrefs.append(href)
+            else:
+                xml_hrefs.append(href)
+        elif href.endswith('.txt'):
+            txt_hrefs.append(href)
+
+    def absolute(href):
+        return "https://www.sec.gov" + href if href.startswith('/') else href
+
+    return (
+        tuple(absolute(h) for h in info_xml_hrefs + xml_hrefs),
+        tuple(absolute(h) for h in txt_hrefs),
+    )
+
+
+def download_and_parse_13f(documents_url):
     """Download 13F filing and parse it"""
     try:
-        # Get filing page
-        response = requests.get(documents_url, headers=headers, timeout=10)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.text, 'html.parser')
-        
-        # Strategy 1: Try XML information table
-        for link in soup.find_all('a'):
-            href = link.get('href', '')
-            text = link.get_text().lower()
-            
-            if '.xml' in href and any(kw in text for kw in ['information', 'infotable', 'table']):
-                xml_url = "https://www.sec.gov" + href if href.startswith('/') else href
-                time.sleep(0.3)
-                
-                xml_response = requests.get(xml_url, headers=headers, timeout=10)
-                xml_response.raise_for_status()
-                
-                result = parse_13f_xml_robust(xml_response.text)
-                if result:
-                    return result
-        
-        # Strategy 2: Try any XML file
-        for link in soup.find_all('a'):
-            href = link.get('href', '')
-            if '.xml' in href:
-                xml_url = "https://www.sec.gov" + href if href.startswith('/') else href
-                time.sleep(0.3)
-                
-                xml_response = requests.get(xml_url, headers=headers, timeout=10)
-                xml_response.raise_for_status()
-                
-                result = parse_13f_xml_robust(xml_response.text)
-                if result:
-                    return result
-        
+        xml_urls, txt_urls = _resolve_13f_links(documents_url)
+
+        # Strategies 1+2: XML information table, then any other XML
+        for xml_url in xml_urls:
+            result = parse_13f_xml_robust(sec_get(xml_url))
+            if result:
+                return result
+
         # Strategy 3: Text fallback (with strict validation)
-        for link in soup.find_all('a'):
-            href = link.get('href', '')
-            if href.endswith('.txt'):
-                txt_url = "https://www.sec.gov" + href if href.startswith('/') else href
-                time.sleep(0.3)
-                
-                txt_response = requests.get(txt_url, headers=headers, timeout=10)
-                txt_response.raise_for_status()
-                
-                result = parse_13f_text_strict(txt_response.text)
-                if result:
-                    return result
-        
+        for txt_url in txt_urls:
+            txt_bytes = sec_get(txt_url)
+
+            result = parse_13f_text_strict(txt_bytes.decode('utf-8', errors='replace'))
+            if result:
+                return result
+
     except Exception as e:
         pass
-    
+
     return None
 
 
 def fetch_all_holdings(filings):
     """Fetch WDAY holdings for all filings"""
     print(f"\n📈 Analyzing {len(filings)} filings for WDAY holdings...")
-    print("(This will take a few minutes due to SEC rate limiting)\n")
-    
-    headers = {
-        'User-Agent': 'InsiderTracker contact@example.com',
-        'Accept-Encoding': 'gzip, deflate',
-        'Host': 'www.sec.gov'
-    }
+    print("(Fetches run in parallel, rate-limited for SEC)\n")
     
     holdings = []
-    
-    for idx, filing in enumerate(filings, 1):
-        print(f"  [{idx}/{len(filings)}] {filing['name']} ({filing['filing_date']})... ", end="", flush=True)
-        
-        result = download_and_parse_13f(filing['documents_url'], headers)
-        
-        if result:
-            result['investor_name'] = filing['name']
-            result['cik'] = filing['cik']
-            result['filing_date'] = filing['filing_date']
-            holdings.append(result)
-            print(f"✓ {result['shares']:,} shares (${result['value_dollars']:,.0f})")
-        else:
-            print("No position")
-        
-        time.sleep(0.5)  # Be nice to SEC
-    
+
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        futures = {
+            executor.submit(download_and_parse_13f, filing['documents_url']): filing
+            for filing in filings
+        }
+
+        for idx, future in enumerate(as_completed(futures), 1):
+            filing = futures[future]
+            print(f"  [{idx}/{len(filings)}] {filing['name']} ({filing['filing_date']})... ", end="", flush=True)
+
+            result = future.result()
+
+            if result:
+                result['investor_name'] = filing['name']
+                result['cik'] = filing['cik']
+                result['filing_date'] = filing['filing_date']
+                holdings.append(result)
+                print(f"✓ {result['shares']:,} shares (${result['value_dollars']:,.0f})")
+            else:
+                print("No position")
+
     return holdings
 
 
-def calculate_stats(holdings):
-    """Calculate ownership statistics"""
-    if not holdings:
-        return None
-    
-    # Keep only most recent filing per investor
+def _latest_per_investor(holdings):
+    """Keep only the most recent filing per investor"""
     by_investor = {}
     for h in holdings:
         name = h['investor_name']
         if name not in by_investor or h['filing_date'] > by_investor[name]['filing_date']:
             by_investor[name] = h
+    return by_investor
+
+
+def calculate_stats(by_investor):
+    """Calculate ownership statistics"""
+    if not by_investor:
+        return None
     
     unique_holdings = list(by_investor.values())
     unique_holdings.sort(key=lambda x: x['shares'], reverse=True)
@@ -341,14 +406,8 @@ def calculate_stats(holdings):
     }
 
 
-def generate_cluster_data(holdings):
+def generate_cluster_data(by_investor):
     """Generate bubble chart data"""
-    by_investor = {}
-    for h in holdings:
-        name = h['investor_name']
-        if name not in by_investor or h['filing_date'] > by_investor[name]['filing_date']:
-            by_investor[name] = h
-    
     cluster = []
     for name, holding in by_investor.items():
         cluster.append({
@@ -362,6 +421,15 @@ def generate_cluster_data(holdings):
     return cluster
 
 
+def _atomic_write(item):
+    """Write (path, data) to a unique temp file then rename into place"""
+    path, data = item
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=path.name + '.')
+    with os.fdopen(fd, 'wb') as fh:
+        fh.write(data)
+    os.replace(tmp_name, path)
+
+
 def main():
     """Main execution"""
     print("=" * 70)
@@ -388,21 +456,23 @@ def main():
     print(f"\n✅ Found {len(holdings)} total holdings")
     print(f"📊 From {len(set(h['investor_name'] for h in holdings))} unique institutions\n")
     
-    stats = calculate_stats(holdings)
-    cluster = generate_cluster_data(holdings)
-    
-    # Save data
-    ownership_file = OUTPUT_DIR / "institutional_ownership.json"
-    with open(ownership_file, 'w') as f:
-        json.dump(stats, f, indent=2)
+    # Reduce to the latest filing per investor once, then share the
+    # result between both post-processing steps
+    by_investor = _latest_per_investor(holdings)
+    stats = calculate_stats(by_investor)
+    cluster = generate_cluster_data(by_investor)
     
-    cluster_file = OUTPUT_DIR / "ownership_cluster.json"
-    with open(cluster_file, 'w') as f:
-        json.dump(cluster, f, indent=2)
+    # Save data in parallel, each file atomically via rename
+    outputs = [
+        (OUTPUT_DIR / "institutional_ownership.json", orjson.dumps(stats, option=orjson.OPT_INDENT_2)),
+        (OUTPUT_DIR / "ownership_cluster.json", orjson.dumps(cluster, option=orjson.OPT_INDENT_2)),
+    ]
+    with ThreadPoolExecutor(max_workers=4) as writer:
+        list(writer.map(_atomic_write, outputs))
     
     print("💾 Saved:")
-    print(f"  • {ownership_file}")
-    print(f"  • {cluster_file}")
+    for path, _ in outputs:
+        print(f"  • {path}")
     
     print("\n" + "=" * 70)
     print("📊 SUMMARY")
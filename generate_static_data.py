@@ -4,58 +4,73 @@ Scrapes SEC EDGAR and generates JSON files for static hosting
 """
 
 import requests
-import json
+import orjson
+import os
+import tempfile
 import time
-import xml.etree.ElementTree as ET
-from bs4 import BeautifulSoup
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from lxml import etree
+from lxml import html as lhtml
+import pandas as pd
 from datetime import datetime
+from functools import lru_cache
+from io import BytesIO
 from pathlib import Path
 
+import sec_cache
+
 # Configuration
 CIK = "0001327811"  # Workday Inc.
 OUTPUT_DIR = Path("./public_data")
 OUTPUT_DIR.mkdir(exist_ok=True)
 
+# One pooled session reusing keep-alive connections to www.sec.gov
+# instead of paying a TLS handshake per request
+SESSION = requests.Session()
+SESSION.headers.update({
+    'User-Agent': 'InsiderTracker contact@example.com',
+    'Accept-Encoding': 'gzip, deflate',
+})
+SESSION.mount('https://', HTTPAdapter(
+    pool_connections=16,
+    pool_maxsize=32,
+    max_retries=Retry(total=3, backoff_factor=0.5)
+))
+
+
 def fetch_sec_filings(cik=CIK, form_type="4"):
-    """Fetch recent SEC Form 4 filings"""
-    headers = {
-        'User-Agent': 'InsiderTracker contact@example.com',
-        'Accept-Encoding': 'gzip, deflate',
-        'Host': 'www.sec.gov'
-    }
-    
-    url = f"https://www.sec.gov/cgi-bin/browse-edgar?action=getcompany&CIK={cik}&type={form_type}&dateb=&owner=include&count=100&search_text="
+    """Fetch the recent-filings list from the EDGAR submissions API"""
+    url = f"https://data.sec.gov/submissions/CIK{int(cik):010d}.json"
     
     print(f"Fetching SEC filings from: {url}")
-    response = requests.get(url, headers=headers, timeout=10)
-    response.raise_for_status()
-    return response.text
+    # Index pages go stale as new filings arrive: short TTL
+    return sec_cache.cached_get(url, SESSION, ttl=sec_cache.INDEX_TTL)
 
 
-def parse_sec_filings_list(html_content):
-    """Parse SEC filings list to extract document links"""
-    soup = BeautifulSoup(html_content, 'html.parser')
+def parse_sec_filings_list(submissions_content, cik=CIK):
+    """Extract Form 4 document links from the submissions JSON"""
+    recent = orjson.loads(submissions_content)['filings']['recent']
     filings = []
     
-    table = soup.find('table', {'class': 'tableFile2'})
-    if not table:
-        return filings
-    
-    rows = table.find_all('tr')[1:]  # Skip header
-    
-    for row in rows[:20]:  # Last 20 filings
-        cols = row.find_all('td')
-        if len(cols) >= 4:
-            filing_type = cols[0].text.strip()
-            filing_date = cols[3].text.strip()
-            documents_link = cols[1].find('a')
-            
-            if documents_link and filing_type == '4':
-                doc_url = "https://www.sec.gov" + documents_link['href']
-                filings.append({
-                    'filing_date': filing_date,
-                    'documents_url': doc_url
-                })
+    for form, filing_date, accession in zip(
+        recent['form'], recent['filingDate'], recent['accessionNumber']
+    ):
+        if form != '4':
+            continue
+        
+        doc_url = (
+            f"https://www.sec.gov/Archives/edgar/data/{int(cik)}/"
+            f"{accession.replace('-', '')}/{accession}-index.htm"
+        )
+        filings.append({
+            'filing_date': filing_date,
+            'documents_url': doc_url
+        })
+        
+        if len(filings) >= 20:  # Last 20 filings
+            break
     
     print(f"Found {len(filings)} Form 4 filings")
     return filings
@@ -64,91 +79,101 @@ def parse_sec_filings_list(html_content):
 def parse_form4_xml(xml_content, filing_date):
     """Parse Form 4 XML to extract transactions"""
     transactions = []
+    owner_name = None
+    title = "Executive"
+    parsed = []
     
     try:
-        root = ET.fromstring(xml_content)
+        # Streaming with a tag filter touches only the elements we care
+        # about and keeps memory flat across runs over many filings; the
+        # {*} wildcard matches the ownership namespace when declared
+        if isinstance(xml_content, str):
+            xml_content = xml_content.encode()
+        context = etree.iterparse(
+            BytesIO(xml_content),
+            events=('end',),
+            tag=('{*}reportingOwner', '{*}nonDerivativeTransaction'),
+            recover=True,
+        )
         
-        # Extract owner info
-        owner = root.find('.//reportingOwner')
-        if owner is None:
-            return transactions
-            
-        owner_name_elem = owner.find('.//rptOwnerName')
-        if owner_name_elem is None:
+        for _, elem in context:
+            if elem.tag.endswith('reportingOwner'):
+                # Joint filings list several owners; keep the first
+                # one's name and title together, as the old full-tree
+                # lookup did
+                if owner_name is None:
+                    owner_name_elem = elem.find('.//{*}rptOwnerName')
+                    if owner_name_elem is not None:
+                        owner_name = owner_name_elem.text
+                    title_elem = elem.find('.//{*}reportingOwnerRelationship/{*}officerTitle')
+                    if title_elem is not None and title_elem.text:
+                        title = title_elem.text
+            else:
+                try:
+                    trans_date_str = elem.findtext('.//{*}transactionDate/{*}value')
+                    shares_text = elem.findtext('.//{*}transactionAmounts/{*}transactionShares/{*}value')
+                    price_text = elem.findtext('.//{*}transactionAmounts/{*}transactionPricePerShare/{*}value')
+                    acq_disp = elem.findtext('.//{*}transactionAmounts/{*}transactionAcquiredDisposedCode/{*}value')
+                    
+                    if all([trans_date_str, shares_text, price_text]):
+                        parsed.append((
+                            trans_date_str,
+                            float(shares_text),
+                            float(price_text),
+                            acq_disp if acq_disp else "D",
+                        ))
+                except Exception as e:
+                    print(f"  Error parsing transaction: {e}")
+            elem.clear(keep_tail=True)
+        
+        if owner_name is None:
             return transactions
-            
-        owner_name = owner_name_elem.text
         
-        # Extract title
-        title_elem = owner.find('.//reportingOwnerRelationship/officerTitle')
-        title = title_elem.text if title_elem is not None else "Executive"
+        for trans_date_str, shares_val, price_val, acq_disp in parsed:
+            total_val = shares_val * price_val
+            trans_type = "Sale" if acq_disp == "D" else "Purchase"
+            
+            transactions.append({
+                'id': f"{owner_name}_{trans_date_str}_{shares_val}",
+                'executive_name': owner_name,
+                'executive_title': title,
+                'transaction_date': trans_date_str,
+                'transaction_type': trans_type,
+                'shares': shares_val,
+                'price_per_share': price_val,
+                'total_value': total_val,
+                'filing_date': filing_date,
+                'form_type': 'Form 4',
+                'created_at': datetime.now().isoformat()
+            })
         
-        # Parse transactions
-        for trans in root.findall('.//nonDerivativeTransaction'):
-            try:
-                trans_date = trans.find('.//transactionDate/value')
-                shares = trans.find('.//transactionAmounts/transactionShares/value')
-                price = trans.find('.//transactionAmounts/transactionPricePerShare/value')
-                acquired_disposed = trans.find('.//transactionAmounts/transactionAcquiredDisposedCode/value')
-                
-                if all([trans_date is not None, shares is not None, price is not None]):
-                    trans_date_str = trans_date.text
-                    shares_val = float(shares.text)
-                    price_val = float(price.text)
-                    total_val = shares_val * price_val
-                    
-                    acq_disp = acquired_disposed.text if acquired_disposed is not None else "D"
-                    trans_type = "Sale" if acq_disp == "D" else "Purchase"
-                    
-                    transactions.append({
-                        'id': f"{owner_name}_{trans_date_str}_{shares_val}",
-                        'executive_name': owner_name,
-                        'executive_title': title,
-                        'transaction_date': trans_date_str,
-                        'transaction_type': trans_type,
-                        'shares': shares_val,
-                        'price_per_share': price_val,
-                        'total_value': total_val,
-                        'filing_date': filing_date,
-                        'form_type': 'Form 4',
-                        'created_at': datetime.now().isoformat()
-                    })
-            except Exception as e:
-                print(f"  Error parsing transaction: {e}")
-                continue
-                
     except Exception as e:
         print(f"  Error parsing XML: {e}")
     
     return transactions
 
 
+@lru_cache(maxsize=512)
+def _resolve_xml_link(documents_url):
+    """Resolve the Form 4 XML URL for a documents page (memoized)"""
+    content = sec_cache.cached_get(documents_url, SESSION)
+    
+    # One C-level XPath over the anchors instead of a BS4 tree walk
+    for href in lhtml.fromstring(content).xpath('//a/@href'):
+        if '.xml' in href and 'xslF345X' not in href:
+            return "https://www.sec.gov" + href if href.startswith('/') else href
+    
+    return None
+
+
 def fetch_and_parse_form4(documents_url, filing_date):
     """Fetch Form 4 XML and parse it"""
-    headers = {
-        'User-Agent': 'InsiderTracker contact@example.com',
-        'Accept-Encoding': 'gzip, deflate',
-        'Host': 'www.sec.gov'
-    }
-    
     try:
-        # Fetch documents page
-        response = requests.get(documents_url, headers=headers, timeout=10)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.text, 'html.parser')
-        
-        # Find XML link
-        for link in soup.find_all('a'):
-            href = link.get('href', '')
-            if '.xml' in href and 'xslF345X' not in href:
-                xml_url = "https://www.sec.gov" + href if href.startswith('/') else href
-                
-                # Fetch XML
-                time.sleep(0.3)  # Rate limiting
-                xml_response = requests.get(xml_url, headers=headers, timeout=10)
-                xml_response.raise_for_status()
-                
-                return parse_form4_xml(xml_response.text, filing_date)
+        xml_url = _resolve_xml_link(documents_url)
+        if xml_url:
+            # Fetch XML
+            time.sleep(0.3)  # Rate limiting
+            return parse_form4_xml(sec_cache.cached_get(xml_url, SESSION), filing_date)
         
     except Exception as e:
         print(f"  Error fetching XML: {e}")
@@ -166,48 +191,47 @@ def generate_stats(transactions):
             'last_updated': 'Never'
         }
     
-    total_sales = sum(
-        t['total_value'] for t in transactions 
-        if t.get('transaction_type') == 'Sale'
-    )
-    
-    unique_execs = len(set(t['executive_name'] for t in transactions))
+    df = pd.DataFrame(transactions)
     
     return {
-        'total_sales_value': total_sales,
-        'total_transactions': len(transactions),
-        'unique_executives': unique_execs,
+        'total_sales_value': float(df.loc[df['transaction_type'].eq('Sale'), 'total_value'].sum()),
+        'total_transactions': len(df),
+        'unique_executives': int(df['executive_name'].nunique()),
         'last_updated': datetime.now().strftime("%Y-%m-%d %H:%M UTC")
     }
 
 
 def generate_executives_summary(transactions):
     """Generate executive-level summary"""
-    exec_data = {}
+    if not transactions:
+        return []
     
-    for trans in transactions:
-        name = trans['executive_name']
-        if name not in exec_data:
-            exec_data[name] = {
-                'name': name,
-                'total_sales': 0,
-                'transaction_count': 0,
-                'latest_transaction': trans['transaction_date']
-            }
-        
-        if trans.get('transaction_type') == 'Sale':
-            exec_data[name]['total_sales'] += trans['total_value']
-        
-        exec_data[name]['transaction_count'] += 1
-        
-        if trans['transaction_date'] > exec_data[name]['latest_transaction']:
-            exec_data[name]['latest_transaction'] = trans['transaction_date']
+    # One vectorized groupby pass instead of per-dict accumulation
+    df = pd.DataFrame(transactions)
+    df['sale_value'] = df['total_value'].where(df['transaction_type'].eq('Sale'), 0.0)
     
-    # Convert to list and sort
-    result = list(exec_data.values())
-    result.sort(key=lambda x: x['total_sales'], reverse=True)
+    summary = (
+        df.groupby('executive_name', sort=False)
+        .agg(
+            total_sales=('sale_value', 'sum'),
+            transaction_count=('executive_name', 'size'),
+            latest_transaction=('transaction_date', 'max'),
+        )
+        .reset_index()
+        .rename(columns={'executive_name': 'name'})
+        .sort_values('total_sales', ascending=False)
+    )
     
-    return result
+    return summary.to_dict('records')
+
+
+def _atomic_write(item):
+    """Write (path, data) to a unique temp file then rename into place"""
+    path, data = item
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=path.name + '.')
+    with os.fdopen(fd, 'wb') as fh:
+        fh.write(data)
+    os.replace(tmp_name, path)
 
 
 def main():
@@ -247,25 +271,22 @@ def main():
     # Step 4: Generate JSON files
     print(f"\n[4/4] Generating JSON files...")
     
-    # transactions.json
-    transactions_file = OUTPUT_DIR / "transactions.json"
-    with open(transactions_file, 'w') as f:
-        json.dump(all_transactions, f, indent=2)
-    print(f"  ✓ Created {transactions_file} ({len(all_transactions)} transactions)")
-    
-    # stats.json
     stats = generate_stats(all_transactions)
-    stats_file = OUTPUT_DIR / "stats.json"
-    with open(stats_file, 'w') as f:
-        json.dump(stats, f, indent=2)
-    print(f"  ✓ Created {stats_file}")
-    
-    # executives.json
     executives = generate_executives_summary(all_transactions)
-    executives_file = OUTPUT_DIR / "executives.json"
-    with open(executives_file, 'w') as f:
-        json.dump(executives, f, indent=2)
-    print(f"  ✓ Created {executives_file} ({len(executives)} executives)")
+    
+    # Serialize everything first, then write the files in parallel and
+    # atomically so a crashed run never leaves half-written JSON
+    outputs = [
+        (OUTPUT_DIR / "transactions.json", orjson.dumps(all_transactions, option=orjson.OPT_INDENT_2)),
+        (OUTPUT_DIR / "stats.json", orjson.dumps(stats, option=orjson.OPT_INDENT_2)),
+        (OUTPUT_DIR / "executives.json", orjson.dumps(executives, option=orjson.OPT_INDENT_2)),
+    ]
+    with ThreadPoolExecutor(max_workers=4) as writer:
+        list(writer.map(_atomic_write, outputs))
+    
+    print(f"  ✓ Created {outputs[0][0]} ({len(all_transactions)} transactions)")
+    print(f"  ✓ Created {outputs[1][0]}")
+    print(f"  ✓ Created {outputs[2][0]} ({len(executives)} executives)")
     
     print("\n" + "=" * 60)
     print("SUCCESS! JSON files ready for upload")
@@ -0,0 +1,78 @@
+"""
+On-disk cache for SEC GET responses
+
+Filing documents and XMLs are immutable once posted, so re-runs of the
+scraper scripts can serve them from disk instead of re-downloading
+everything. Index pages change as new filings arrive, so they get a
+short TTL.
+"""
+
+import hashlib
+import os
+import tempfile
+import time
+from pathlib import Path
+
+CACHE_DIR = Path("./.cache/sec")
+
+# TTLs in seconds: index pages for a day, immutable filing documents
+# for 90 days
+INDEX_TTL = 24 * 3600
+DOCUMENT_TTL = 90 * 24 * 3600
+
+# Set SEC_CACHE_DEBUG=1 to log per-request body sizes and see where
+# the bandwidth goes
+DEBUG = bool(os.environ.get('SEC_CACHE_DEBUG'))
+
+# Reject anything implausibly large (misclassified or adversarial
+# files) instead of buffering it
+MAX_BODY_BYTES = 50 * 1024 * 1024
+
+
+def _cache_path(url):
+    return CACHE_DIR / hashlib.md5(url.encode()).hexdigest()
+
+
+def cached_get(url, session, ttl=DOCUMENT_TTL, timeout=10, rate_limiter=None):
+    """Return response bytes for url, served from disk when still fresh"""
+    path = _cache_path(url)
+    try:
+        if path.exists() and (time.time() - path.stat().st_mtime) < ttl:
+            return path.read_bytes()
+    except OSError:
+        pass  # unreadable cache entry; fall through to the network
+
+    if rate_limiter is not None:
+        rate_limiter.acquire()
+
+    # Stream the body to disk in chunks so large filings never sit in
+    # memory twice, then publish atomically so a crashed run never
+    # leaves a torn entry. The temp name is unique per writer so two
+    # threads fetching the same uncached url cannot interleave writes
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(dir=CACHE_DIR)
+    try:
+        with os.fdopen(fd, 'wb') as fh, \
+                session.get(url, timeout=timeout, stream=True) as response:
+            response.raise_for_status()
+            size = 0
+            # iter_content decodes gzip-in-transit, so size below is the
+            # uncompressed body as parsers will see it
+            for chunk in response.iter_content(chunk_size=64 * 1024):
+                size += len(chunk)
+                if size > MAX_BODY_BYTES:
+                    raise ValueError(
+                        f"Response for {url} exceeds {MAX_BODY_BYTES} bytes"
+                    )
+                fh.write(chunk)
+    except BaseException:
+        Path(tmp_name).unlink(missing_ok=True)
+        raise
+
+    os.replace(tmp_name, path)
+
+    if DEBUG:
+        wire_size = response.headers.get('Content-Length', '?')
+        print(f"[sec_cache] {size / 1024:.1f} KB ({wire_size} on the wire) {url}")
+
+    return path.read_bytes()
@@ -5,20 +5,137 @@ Modifies files in place - run this in the same directory as your JSON files
 
 import requests
 from bs4 import BeautifulSoup
-import json
+import orjson
+import re
+from pathlib import Path
+from io import BytesIO
+from lxml import etree
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, TimeoutError as FutureTimeout, wait
+from dataclasses import dataclass
 from datetime import datetime
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
-def get_current_price():
+from cache import FileCache
+
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    # Explicit so a future headers change can't silently drop
+    # compression; Yahoo pages gzip ~6-10x
+    'Accept-Encoding': 'gzip, deflate',
+}
+
+# Shared session so both Yahoo fetches reuse one TCP+TLS connection
+# and the default headers are merged once instead of per call
+SESSION = requests.Session()
+SESSION.headers.update(HEADERS)
+SESSION.mount('https://', HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=4,
+    max_retries=Retry(total=3, backoff_factor=0.5)
+))
+
+# How long the primary request gets before a hedged duplicate is fired
+HEDGE_DELAY_SECONDS = 1.5
+
+# Sized for both fetchers hedging at once
+_HEDGE_EXECUTOR = ThreadPoolExecutor(max_workers=4)
+
+def _get_with_hedge(session, url, timeout=10):
+    """GET url, racing a second request if the first one stalls
+
+    Yahoo occasionally hangs a request for seconds; if the primary has
+    not answered within HEDGE_DELAY_SECONDS an identical hedge request
+    is fired and whichever response lands first wins.
+    """
+    primary = _HEDGE_EXECUTOR.submit(session.get, url, timeout=timeout)
+    try:
+        return primary.result(timeout=HEDGE_DELAY_SECONDS)
+    except FutureTimeout:
+        pass
+    
+    hedge = _HEDGE_EXECUTOR.submit(session.get, url, timeout=timeout)
+    done, _ = wait([primary, hedge], return_when=FIRST_COMPLETED)
+    for future in done:
+        if future.exception() is None:
+            return future.result()
+    return next(iter(done)).result()
+
+def _in_holders_section(row):
+    """True if the row sits inside Yahoo's holders-table section"""
+    node = row.getparent()
+    while node is not None:
+        if node.tag == 'section' and node.get('data-testid') == 'holders-table':
+            return True
+        node = node.getparent()
+    return False
+
+# Per-endpoint TTLs: price moves minute to minute, the holders table
+# only changes with quarterly filings
+PRICE_CACHE = FileCache(ttl_seconds=300)
+HOLDERS_CACHE = FileCache(ttl_seconds=12 * 3600)
+
+# One regex match plus a dict lookup replaces the per-field suffix
+# if-chains when parsing "25.1M" / "6.2B" / "1,234,567" style numbers
+NUM_RE = re.compile(r'^([\d.,]+)\s*([MB]?)%?$')
+MULT = {'': 1, 'M': 1_000_000, 'B': 1_000_000_000}
+
+# Pulls the quote straight out of the raw bytes; attribute order on the
+# fin-streamer element can vary, so both orders are accepted
+PRICE_RE = re.compile(
+    rb'data-symbol="WDAY"[^>]*data-field="regularMarketPrice"[^>]*data-value="([\d.]+)"'
+    rb'|data-field="regularMarketPrice"[^>]*data-symbol="WDAY"[^>]*data-value="([\d.]+)"'
+)
+
+# 'Sep 30, 2025' -> '2025-09-30' without a strptime/strftime round trip
+DATE_RE = re.compile(r'^([A-Z][a-z]{2}) (\d{1,2}), (\d{4})$')
+MONTHS = {
+    'Jan': '01', 'Feb': '02', 'Mar': '03', 'Apr': '04',
+    'May': '05', 'Jun': '06', 'Jul': '07', 'Aug': '08',
+    'Sep': '09', 'Oct': '10', 'Nov': '11', 'Dec': '12',
+}
+
+@dataclass(slots=True)
+class Holder:
+    """One institutional holder row from the Yahoo holders table"""
+    name: str
+    shares: int
+    value: int
+    percent: float
+    filing_date: str
+
+def parse_num(text):
+    """Parse a Yahoo-style number ('25.1M', '6.2B', '1,234,567') to int"""
+    text = text.strip()
+    # Fast path: plain digit runs skip the regex and the float round trip
+    if text.isdigit():
+        return int(text)
+    match = NUM_RE.match(text)
+    if not match:
+        return 0
+    try:
+        return int(float(match.group(1).replace(',', '')) * MULT[match.group(2)])
+    except ValueError:
+        # Strings like '1.2.3' match NUM_RE but are not numbers
+        return 0
+
+def get_current_price(session=SESSION):
     """Fetch current WDAY stock price from Yahoo Finance"""
     try:
         url = "https://finance.yahoo.com/quote/WDAY/"
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
-        }
-        response = requests.get(url, headers=headers, timeout=10)
-        soup = BeautifulSoup(response.content, 'html.parser')
+        content = PRICE_CACHE.get(url)
+        if content is None:
+            content = _get_with_hedge(session, url).content
+            PRICE_CACHE.set(url, content)
+        
+        # Fast path: one regex scan over the raw bytes instead of
+        # building a DOM for a single attribute
+        match = PRICE_RE.search(content)
+        if match:
+            return float(match.group(1) or match.group(2))
         
-        # Try to find price element
+        # Fallback: full parse in case the markup shifted
+        soup = BeautifulSoup(content, 'lxml')
         price_element = soup.find('fin-streamer', {'data-symbol': 'WDAY', 'data-field': 'regularMarketPrice'})
         if price_element:
             price_value = price_element.get('data-value')
@@ -33,104 +150,103 @@ def get_current_price():
         print(f"Error fetching price: {e}")
         return None
 
-def get_institutional_ownership():
+def get_institutional_ownership(session=SESSION):
     """Fetch institutional ownership from Yahoo Finance holders page"""
     try:
         url = "https://finance.yahoo.com/quote/WDAY/holders/"
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
-        }
-        response = requests.get(url, headers=headers, timeout=10)
-        soup = BeautifulSoup(response.content, 'html.parser')
-        
+        content = HOLDERS_CACHE.get(url)
+        if content is None:
+            content = _get_with_hedge(session, url).content
+            HOLDERS_CACHE.set(url, content)
         holders = []
+        generic = []
         
-        # Find all tables on the page
-        tables = soup.find_all('table')
-        
-        for table in tables:
-            rows = table.find_all('tr')
+        # Stream <tr> elements instead of materializing the whole DOM;
+        # each row is cleared once read so memory stays flat. Rows from
+        # the holders section are preferred, any other table row serves
+        # as fallback when Yahoo's markup changes.
+        # Explicit guards keep the hot loop free of exception handlers;
+        # only the float() that can genuinely fail is wrapped
+        for _, row in etree.iterparse(BytesIO(content), events=('end',), tag='tr', html=True):
+            cols = row.findall('td')
             
-            # Look for institutional holder data
-            for row in rows[1:]:  # Skip header row
-                cols = row.find_all('td')
-                
-                if len(cols) >= 4:
-                    try:
-                        # Extract data from columns
-                        name = cols[0].text.strip()
-                        shares_text = cols[1].text.strip().replace(',', '')
-                        date_text = cols[2].text.strip()
-                        percent_text = cols[3].text.strip().replace('%', '')
-                        value_text = cols[4].text.strip().replace(',', '') if len(cols) > 4 else '0'
-                        
-                        # Skip if this looks like a header row
-                        if 'Holder' in name or not shares_text:
-                            continue
-                        
-                        # Parse shares (handle M, B suffixes)
-                        shares = 0
-                        if 'M' in shares_text:
-                            shares = int(float(shares_text.replace('M', '')) * 1_000_000)
-                        elif 'B' in shares_text:
-                            shares = int(float(shares_text.replace('B', '')) * 1_000_000_000)
-                        else:
-                            try:
-                                shares = int(float(shares_text))
-                            except:
-                                continue
-                        
-                        # Parse value (handle M, B suffixes)
-                        value = 0
-                        if 'M' in value_text:
-                            value = int(float(value_text.replace('M', '')) * 1_000_000)
-                        elif 'B' in value_text:
-                            value = int(float(value_text.replace('B', '')) * 1_000_000_000)
-                        else:
-                            try:
-                                value = int(float(value_text))
-                            except:
-                                value = 0
-                        
-                        # Parse percentage
-                        try:
-                            percent = float(percent_text)
-                        except:
-                            percent = 0.0
-                        
-                        # Parse date (format: "Sep 30, 2025")
-                        try:
-                            filing_date = datetime.strptime(date_text, '%b %d, %Y').strftime('%Y-%m-%d')
-                        except:
-                            filing_date = date_text
-                        
-                        holders.append({
-                            'name': name,
-                            'shares': shares,
-                            'value': value,
-                            'percent': percent,
-                            'filing_date': filing_date
-                        })
-                        
-                        # Get top 10 holders
-                        if len(holders) >= 10:
-                            break
-                            
-                    except Exception as e:
-                        print(f"Error parsing row: {e}")
-                        continue
-                
-                if len(holders) >= 10:
-                    break
+            if len(cols) < 4:
+                row.clear(keep_tail=True)
+                continue
             
+            # Extract data from columns
+            name = ''.join(cols[0].itertext()).strip()
+            shares_text = ''.join(cols[1].itertext()).strip().replace(',', '')
+            date_text = ''.join(cols[2].itertext()).strip()
+            percent_text = ''.join(cols[3].itertext()).strip().replace('%', '')
+            value_text = ''.join(cols[4].itertext()).strip().replace(',', '') if len(cols) > 4 else '0'
+            
+            targeted = _in_holders_section(row)
+            row.clear(keep_tail=True)
+            
+            # Skip if this looks like a header row
+            if 'Holder' in name or not shares_text:
+                continue
+            
+            # Parse shares and value (handles M, B suffixes)
+            shares = parse_num(shares_text)
+            if not shares:
+                continue
+            value = parse_num(value_text)
+            
+            # Parse percentage
+            try:
+                percent = float(percent_text)
+            except ValueError:
+                percent = 0.0
+            
+            # Parse date (format: "Sep 30, 2025")
+            date_match = DATE_RE.match(date_text)
+            if date_match and date_match.group(1) in MONTHS:
+                month, day, year = date_match.groups()
+                filing_date = f'{year}-{MONTHS[month]}-{int(day):02d}'
+            else:
+                filing_date = date_text
+            
+            (holders if targeted else generic).append(
+                Holder(name, shares, value, percent, filing_date)
+            )
+            
+            # Get top 10 holders
             if len(holders) >= 10:
                 break
         
-        return holders
+        chosen = holders if holders else generic[:10]
+        
+        # Build both downstream JSON shapes and the totals in one pass
+        # so update_json_files never re-walks or re-dicts the holders
+        holdings_by_investor = []
+        ownership_cluster = []
+        total_shares = total_value = 0
+        for i, h in enumerate(chosen):
+            total_shares += h.shares
+            total_value += h.value
+            holdings_by_investor.append({
+                'investor_name': h.name,
+                'shares': h.shares,
+                'value_dollars': h.value,
+                'percent_outstanding': h.percent,
+                'filing_date': h.filing_date
+            })
+            if i < 5:
+                ownership_cluster.append({
+                    'name': h.name,
+                    'shares': h.shares,
+                    'value': h.value,
+                    'percent': h.percent,
+                    'filing_date': h.filing_date
+                })
+        
+        return chosen, holdings_by_investor, ownership_cluster, total_shares, total_value
         
     except Exception as e:
         print(f"Error fetching institutional ownership: {e}")
-        return []
+        return [], [], [], 0, 0
 
 def update_json_files():
     """Update all JSON files with fresh data"""
@@ -140,36 +256,42 @@ def update_json_files():
     print("=" * 60)
     print()
     
-    # Get fresh data
+    # Get fresh data: both fetches run concurrently, so the wall-clock
+    # cost is the slower of the two round-trips
     print("[1/3] Fetching current stock price...")
-    current_price = get_current_price()
+    print("[2/3] Fetching institutional ownership data...")
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        price_future = executor.submit(get_current_price, SESSION)
+        holders_future = executor.submit(get_institutional_ownership, SESSION)
+        current_price = price_future.result()
+        (institutional_holders, holdings_by_investor, ownership_cluster,
+         total_shares, total_value) = holders_future.result()
+    
     if current_price:
         print(f"✓ Current WDAY price: ${current_price:.2f}")
     else:
         print("✗ Could not fetch current price")
     print()
     
-    print("[2/3] Fetching institutional ownership data...")
-    institutional_holders = get_institutional_ownership()
     if institutional_holders:
         print(f"✓ Found {len(institutional_holders)} institutional holders")
-        print(f"   Top holder: {institutional_holders[0]['name']} with {institutional_holders[0]['shares']:,} shares")
+        print(f"   Top holder: {institutional_holders[0].name} with {institutional_holders[0].shares:,} shares")
     else:
         print("✗ Could not fetch institutional ownership data")
     print()
     
     # Update stats.json with current price
     print("[3/3] Updating JSON files...")
+    now = datetime.now().strftime('%Y-%m-%d %H:%M UTC')
     try:
-        with open('stats.json', 'r') as f:
-            stats = json.load(f)
+        stats_path = Path('stats.json')
+        stats = orjson.loads(stats_path.read_bytes())
         
         if current_price:
             stats['current_price'] = current_price
-        stats['last_updated'] = datetime.now().strftime('%Y-%m-%d %H:%M UTC')
+        stats['last_updated'] = now
         
-        with open('stats.json', 'w') as f:
-            json.dump(stats, f, indent=2)
+        stats_path.write_bytes(orjson.dumps(stats, option=orjson.OPT_INDENT_2))
         print("✓ Updated stats.json with current price")
     except Exception as e:
         print(f"✗ Error updating stats.json: {e}")
@@ -177,31 +299,19 @@ def update_json_files():
     # Update institutional_ownership.json
     if institutional_holders:
         try:
-            total_shares = sum(h['shares'] for h in institutional_holders)
-            total_value = sum(h['value'] for h in institutional_holders)
-            
             institutional_data = {
                 'total_institutional_shares': total_shares,
                 'total_institutional_value': total_value,
                 'number_of_institutions': len(institutional_holders),
-                'largest_holder': institutional_holders[0]['name'],
-                'largest_holder_shares': institutional_holders[0]['shares'],
-                'largest_holder_percent': institutional_holders[0]['percent'],
-                'last_updated': datetime.now().strftime('%Y-%m-%d %H:%M UTC'),
-                'holdings_by_investor': [
-                    {
-                        'investor_name': h['name'],
-                        'shares': h['shares'],
-                        'value_dollars': h['value'],
-                        'percent_outstanding': h['percent'],
-                        'filing_date': h['filing_date']
-                    }
-                    for h in institutional_holders
-                ]
+                'largest_holder': institutional_holders[0].name,
+                'largest_holder_shares': institutional_holders[0].shares,
+                'largest_holder_percent': institutional_holders[0].percent,
+                'last_updated': now,
+                'holdings_by_investor': holdings_by_investor
             }
             
-            with open('institutional_ownership.json', 'w') as f:
-                json.dump(institutional_data, f, indent=2)
+            with open('institutional_ownership.json', 'wb') as f:
+                f.write(orjson.dumps(institutional_data, option=orjson.OPT_INDENT_2))
             print("✓ Updated institutional_ownership.json with accurate data")
             
         except Exception as e:
@@ -209,19 +319,8 @@ def update_json_files():
         
         # Update ownership_cluster.json (top 5 for charts)
         try:
-            ownership_cluster = [
-                {
-                    'name': h['name'],
-                    'shares': h['shares'],
-                    'value': h['value'],
-                    'percent': h['percent'],
-                    'filing_date': h['filing_date']
-                }
-                for h in institutional_holders[:5]
-            ]
-            
-            with open('ownership_cluster.json', 'w') as f:
-                json.dump(ownership_cluster, f, indent=2)
+            with open('ownership_cluster.json', 'wb') as f:
+                f.write(orjson.dumps(ownership_cluster, option=orjson.OPT_INDENT_2))
             print("✓ Updated ownership_cluster.json with top 5 holders")
             
         except Exception as e:
@@ -233,17 +332,21 @@ def update_json_files():
     print("=" * 60)
     print()
     
-    # Show summary
-    if current_price:
-        print(f"Current Stock Price: ${current_price:.2f}")
-    if institutional_holders:
-        print(f"Institutional Holders: {len(institutional_holders)}")
+    # Show summary: format everything once up front
+    price_str = f"${current_price:.2f}" if current_price else None
+    num_holders = len(institutional_holders) if institutional_holders else 0
+    top_holder = institutional_holders[0] if num_holders else None
+    
+    if price_str:
+        print(f"Current Stock Price: {price_str}")
+    if top_holder:
+        print(f"Institutional Holders: {num_holders}")
         print(f"Total Institutional Value: ${total_value:,.0f}")
-        print(f"Top Holder: {institutional_holders[0]['name']} ({institutional_holders[0]['percent']}%)")
+        print(f"Top Holder: {top_holder.name} ({top_holder.percent}%)")
     print()
     print("Files updated:")
     print("  ✓ stats.json")
-    if institutional_holders:
+    if num_holders:
         print("  ✓ institutional_ownership.json")
         print("  ✓ ownership_cluster.json")
     print()